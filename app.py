@@ -1,25 +1,27 @@
-import json
 import asyncio
 import io
 import os
-import hashlib
-import tempfile
+import re
+import string
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Final
+import orjson
 import streamlit as st
 import streamlit.components.v1 as components
 from dotenv import load_dotenv
-from openai import OpenAI
-from groq import Groq
-import edge_tts
 
 load_dotenv()
 
+# Snapshot st.secrets once; without a secrets file every lookup would raise.
+try:
+    secrets = dict(st.secrets)
+except Exception:
+    secrets = {}
+
 def get_secret(key, default=None):
-    try:
-        if key in st.secrets:
-            return st.secrets[key]
-    except Exception:
-        pass
-    return os.getenv(key, default)
+    return secrets.get(key) or os.getenv(key, default)
 
 openai_api_key = get_secret("OPENAI_API_KEY")
 groq_api_key = get_secret("GROQ_API_KEY")
@@ -32,21 +34,128 @@ if missing:
     st.error(f"Missing API keys: {', '.join(missing)}")
     st.stop()
 
-openai_audio_client = OpenAI(api_key=openai_api_key)
-groq_client = Groq(api_key=groq_api_key)
-
-async def _synthesize_speech(text: str) -> bytes:
-    communicate = edge_tts.Communicate(text, voice="en-US-AndrewNeural", rate="+5%", pitch="-3Hz")
+# Cached so the clients' httpx connection pools (and their kept-alive TLS
+# sockets) survive Streamlit reruns instead of being rebuilt every turn.
+# The SDKs are imported on first use so they don't delay the first paint.
+@st.cache_resource
+def get_openai_client(api_key):
+    from openai import OpenAI
+    return OpenAI(api_key=api_key)
+
+# httpx drops idle pooled connections after 5 s by default, well before the
+# user has listened to a reply and recorded the next question. Keeping them
+# for a few minutes lets the next turn reuse the warm TLS connection.
+GROQ_KEEPALIVE_SECONDS = 300
+
+@st.cache_resource
+def get_groq_client(api_key):
+    import httpx
+    from groq import DefaultHttpxClient, Groq
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=GROQ_KEEPALIVE_SECONDS)
+    )
+    return Groq(api_key=api_key, http_client=http_client)
+
+TTS_VOICE = "en-US-AndrewNeural"
+TTS_RATE = "+5%"
+TTS_PITCH = "-3Hz"
+TTS_CACHE_SIZE = 128
+
+# Short stock sentences ("Not much.", "Yeah, sometimes.") come up often, so
+# recent clips are kept process-wide. st.cache_data can't wrap the coroutine
+# the pipeline awaits, hence a small LRU held by a cached resource.
+@st.cache_resource
+def get_speech_cache():
+    return OrderedDict(), threading.Lock()
+
+async def _synthesize_speech(text: str) -> list:
+    key = (text.strip(), TTS_VOICE, TTS_RATE, TTS_PITCH)
+    cache, lock = get_speech_cache()
+    with lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+    import edge_tts
+    communicate = edge_tts.Communicate(key[0], voice=TTS_VOICE, rate=TTS_RATE, pitch=TTS_PITCH)
+    chunks = [chunk["data"] async for chunk in communicate.stream() if chunk["type"] == "audio"]
+
+    with lock:
+        cache[key] = chunks
+        if len(cache) > TTS_CACHE_SIZE:
+            cache.popitem(last=False)
+    return chunks
+
+# Whisper works at 16 kHz mono; recording at that rate keeps uploads small.
+WHISPER_SAMPLE_RATE = 16000
+
+# Only the system prompt and the most recent turns are sent to the model,
+# so per-turn prompt size stays flat as the conversation grows.
+CONTEXT_TURNS = 8
+
+def _context_window(history):
+    return [history[0]] + history[1:][-2 * CONTEXT_TURNS:]
+
+# Cap on edge-tts websockets a single reply may hold open at once.
+TTS_MAX_CONCURRENCY = 3
+
+def _is_speakable(sentence):
+    # Fragments like "..." have nothing for edge-tts to say.
+    return any(ch.isalnum() for ch in sentence)
+
+async def _speak(sentence, limit):
+    """Synthesize one sentence; a failure only drops that sentence's audio, never the reply."""
+    async with limit:
+        try:
+            return await _synthesize_speech(sentence)
+        except Exception:
+            return []
+
+# A sentence is complete once its closing punctuation is followed by whitespace,
+# so decimals like "3.5" mid-stream are not cut early.
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+async def _respond(messages, placeholder):
+    """Stream the reply into ``placeholder`` and start speech synthesis as each sentence completes."""
+    stream = await asyncio.to_thread(
+        get_groq_client(groq_api_key).chat.completions.create,
+        model="llama-3.3-70b-versatile",
+        messages=messages,
+        temperature=0.7,
+        max_tokens=250,
+        stream=True
+    )
+    chunks = iter(stream)
+    limit = asyncio.Semaphore(TTS_MAX_CONCURRENCY)
+    speech_tasks = []
+    reply = ""
+    pending = ""
+
+    while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            continue
+        reply += delta
+        pending += delta
+        placeholder.markdown(LATEST_ASSISTANT_HTML.format(content=reply), unsafe_allow_html=True)
+        *sentences, pending = SENTENCE_END.split(pending)
+        for sentence in sentences:
+            if _is_speakable(sentence):
+                speech_tasks.append(asyncio.create_task(_speak(sentence, limit)))
+
+    if _is_speakable(pending):
+        speech_tasks.append(asyncio.create_task(_speak(pending, limit)))
+
+    # Write each clip's chunks straight into one buffer, in sentence order,
+    # instead of materializing per-sentence byte strings and joining them.
     audio_buffer = io.BytesIO()
-    async for chunk in communicate.stream():
-        if chunk["type"] == "audio":
-            audio_buffer.write(chunk["data"])
+    for task in speech_tasks:
+        for data in await task:
+            audio_buffer.write(data)
     audio_buffer.seek(0)
-    return audio_buffer.read()
-
+    # None when nothing could be spoken, so no empty clip is played.
+    return reply, audio_buffer if audio_buffer.getbuffer().nbytes else None
 
-PERSONA_FILE = "persona.json"
-FACTS_FILE = "facts.json"
 
 st.set_page_config(
     page_title="Talk to Danish",
@@ -55,45 +164,42 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PERSONA_FILE = os.path.join(BASE_DIR, "persona.json")
-FACTS_FILE = os.path.join(BASE_DIR, "facts.json")
+BASE_DIR: Final = Path(__file__).resolve().parent
+PERSONA_FILE: Final = BASE_DIR / "persona.json"
+FACTS_FILE: Final = BASE_DIR / "facts.json"
 
-def file_hash(path):
-    with open(path, "rb") as f:
-        return hashlib.md5(f.read()).hexdigest()
+def file_key(path):
+    # A stat() is enough to notice edits; no need to read and hash the file on every rerun.
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
 
-@st.cache_data
-def load_data(persona_hash, facts_hash):
-    with open(PERSONA_FILE, "r", encoding="utf-8") as f:
-        persona = json.load(f)
+@st.cache_data(persist="disk", show_spinner=False)
+def load_data(persona_key, facts_key):
+    with open(PERSONA_FILE, "rb") as f:
+        persona = orjson.loads(f.read())
 
-    with open(FACTS_FILE, "r", encoding="utf-8") as f:
-        facts = json.load(f)
+    with open(FACTS_FILE, "rb") as f:
+        facts = orjson.loads(f.read())
 
-    return persona, facts
+    facts_str = orjson.dumps(facts, option=orjson.OPT_INDENT_2).decode()
 
-persona, facts = load_data(file_hash(PERSONA_FILE), file_hash(FACTS_FILE))
+    return persona, facts, facts_str
 
-# Initialize Session State
-if "messages" not in st.session_state:
-    persona_str = json.dumps(persona, indent=2)
-    facts_str = json.dumps(facts, indent=2)
-    system_prompt = f"""
-    You are {persona.get('name', 'Danish Akhtar')}.
+SYSTEM_PROMPT_TEMPLATE = string.Template("""
+    You are $name.
     
     **Identity & Behavior:**
-    {persona.get('role', 'Voice Agent')}
-    Tone: {persona.get('tone', 'Professional')}
-    Speaking Style: {persona.get('speaking_style', 'Natural')}
-    Context: {persona.get('context', 'Interview')}
+    $role
+    Tone: $tone
+    Speaking Style: $speaking_style
+    Context: $context
     
     **Instructions:**
-    {chr(10).join(persona.get('instructions', []))}
+    $instructions
     
     **Grounded Facts:**
     Use these facts to answer questions. Do not invent contradictory information.
-    {facts_str}
+    $facts_str
     
     **PERSONAL REALITY RULE:**
     
@@ -187,11 +293,31 @@ if "messages" not in st.session_state:
     - If a fact is missing, admit uncertainty naturally.
     - Stay in character.
     - Avoid markdown formatting in responses (like **bold** or points) as they don't translate well to TTS. Keep it plain text or natural speech patterns.
-    """
+    """)
+
+@st.cache_resource
+def build_system_prompt(persona_key, facts_key):
+    persona, facts, facts_str = load_data(persona_key, facts_key)
+    return SYSTEM_PROMPT_TEMPLATE.substitute(
+        name=persona.get('name', 'Danish Akhtar'),
+        role=persona.get('role', 'Voice Agent'),
+        tone=persona.get('tone', 'Professional'),
+        speaking_style=persona.get('speaking_style', 'Natural'),
+        context=persona.get('context', 'Interview'),
+        instructions="\n".join(persona.get('instructions', [])),
+        facts_str=facts_str
+    )
+
+# Initialize Session State
+if "messages" not in st.session_state:
+    system_prompt = build_system_prompt(file_key(PERSONA_FILE), file_key(FACTS_FILE))
     st.session_state.messages = [{"role": "system", "content": system_prompt}]
 
 
-st.markdown("""
+# Static markup is kept in module constants and emitted in as few elements as
+# possible. It cannot be emitted only on the first run: Streamlit drops any
+# element a rerun does not emit, which would unstyle the page.
+PAGE_CSS = """
     <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600&display=swap');
 
@@ -484,208 +610,80 @@ st.markdown("""
     .stDeployButton {display:none;}
     
     </style>
-""", unsafe_allow_html=True)
+"""
 
-
-st.markdown("""
+HEADER_HTML = """
 <div class="header-container">
     <div class="header-title">Talk to Danish</div>
     <div class="header-subtitle">Ask anything about my work, experience, or ideas</div>
 </div>
-""", unsafe_allow_html=True)
-
-
-history = st.session_state.messages
-if len(history) > 1: # Skip system prompt
-    # Identify the index of the last assistant message
-    last_assistant_idx = -1
-    for i in range(len(history) - 1, -1, -1):
-        if history[i]["role"] == "assistant":
-            last_assistant_idx = i
-            break
-
-    for i, msg in enumerate(history):
-        if msg["role"] == "system":
-            continue
-        
-        if msg["role"] == "user":
-            st.markdown(f"""
-            <div class="msg-user">
-                <span class="msg-user-text">“{msg['content']}”</span>
-            </div>
-            """, unsafe_allow_html=True)
-            
-        elif msg["role"] == "assistant":
-            if i == last_assistant_idx:
-                # Latest Response (Emphasis)
-                st.markdown(f"""
-                <div class="msg-assistant-latest">
-                    {msg['content']}
-                </div>
-                """, unsafe_allow_html=True)
-                
-                
-                
-            else:
-                # Previous Response (Faded)
-                st.markdown(f"""
-                <div class="msg-assistant-prev">
-                    {msg['content']}
-                </div>
-                """, unsafe_allow_html=True)
-
-
-
-# Background gradient for dock
-st.markdown('<div class="dock-background"></div>', unsafe_allow_html=True)
+"""
 
-# Visual indicator dots
-st.markdown("""
+# Background gradient, visual indicator dots and microphone hint for the dock
+DOCK_HTML = """
+<div class="dock-background"></div>
 <div class="mic-indicator">
     <div class="mic-dot"></div>
     <div class="mic-dot"></div>
     <div class="mic-dot"></div>
 </div>
-""", unsafe_allow_html=True)
-
-# Microphone hint text
-st.markdown("""
 <div class="mic-hint">
     Click the mic button below to start/stop speaking
 </div>
-""", unsafe_allow_html=True)
+"""
 
-if "input_key" not in st.session_state:
-    st.session_state.input_key = 0
+st.markdown(PAGE_CSS + HEADER_HTML, unsafe_allow_html=True)
 
-# Audio Input Widget - Now styled to be prominent and clear
-audio_value = st.audio_input("Tap to Speak", label_visibility="hidden", key=f"audio_input_{st.session_state.input_key}")
-
-# JavaScript to enhance button text and behavior
-st.markdown("""
-<script>
-(function() {
-    function enhanceAudioButton() {
-        const audioInput = window.parent.document.querySelector('div[data-testid="stAudioInput"] button');
-        if (audioInput) {
-            const currentText = audioInput.textContent.trim();
-            const ariaLabel = audioInput.getAttribute('aria-label') || '';
-            
-            // Check if recording
-            if (ariaLabel.includes('Stop') || ariaLabel.includes('stop') || currentText.includes('Stop')) {
-                if (!currentText.includes('🔴')) {
-                    audioInput.innerHTML = '<span style="font-size: 1.2rem; margin-right: 8px;">🔴</span> Recording...';
-                }
-            } else {
-                // Not recording - show tap to speak
-                if (!currentText.includes('🎙️') && !currentText.includes('Tap to Speak')) {
-                    audioInput.innerHTML = '<span style="font-size: 1.3rem; margin-right: 10px; display: inline-block; animation: micPulse 2s ease-in-out infinite;">🎙️</span> Tap to Speak';
-                }
-            }
-            
-            // Monitor for state changes
-            const observer = new MutationObserver(function() {
-                setTimeout(enhanceAudioButton, 50);
-            });
-            
-            observer.observe(audioInput, {
-                childList: true,
-                characterData: true,
-                subtree: true,
-                attributes: true,
-                attributeFilter: ['aria-label']
-            });
-        } else {
-            // Retry if button not found yet
-            setTimeout(enhanceAudioButton, 100);
-        }
-    }
-    
-    // Add animation for mic icon
-    const style = document.createElement('style');
-    style.textContent = `
-        @keyframes micPulse {
-            0%, 100% { transform: scale(1); opacity: 1; }
-            50% { transform: scale(1.15); opacity: 0.85; }
-        }
-    `;
-    document.head.appendChild(style);
-    
-    // Run on page load
-    if (document.readyState === 'loading') {
-        document.addEventListener('DOMContentLoaded', enhanceAudioButton);
-    } else {
-        enhanceAudioButton();
-    }
-    
-    // Also run after Streamlit updates
-    setTimeout(enhanceAudioButton, 500);
-    setInterval(enhanceAudioButton, 1000);
-})();
-</script>
-""", unsafe_allow_html=True)
 
+USER_MESSAGE_HTML = """
+<div class="msg-user">
+    <span class="msg-user-text">“{content}”</span>
+</div>
+"""
 
-if audio_value:
-    with st.spinner("Listening..."):
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_audio:
-                tmp_audio.write(audio_value.read())
-                tmp_audio_path = tmp_audio.name
+# Previous Response (Faded)
+PREV_ASSISTANT_HTML = """
+<div class="msg-assistant-prev">
+    {content}
+</div>
+"""
 
-            try:
-                with open(tmp_audio_path, "rb") as audio_file:
-                    transcription = groq_client.audio.transcriptions.create(
-                        model="whisper-large-v3",
-                        file=audio_file,
-                        response_format="text",
-                        language="en"
-                    )
-            except Exception as groq_err:
-                with open(tmp_audio_path, "rb") as audio_file:
-                    transcription = openai_audio_client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file,
-                        response_format="text",
-                        language="en"
-                    )
+# Latest Response (Emphasis)
+LATEST_ASSISTANT_HTML = """
+<div class="msg-assistant-latest">
+    {content}
+</div>
+"""
 
-            user_text = transcription.text if hasattr(transcription, 'text') else str(transcription)
-            os.remove(tmp_audio_path)
+def render_history():
+    # One forward pass builds the whole conversation, emitted as a single element.
+    parts = []
+    latest_idx, latest_msg = None, None
+    for msg in st.session_state.messages[1:]: # Skip system prompt
+        if msg["role"] == "user":
+            parts.append(USER_MESSAGE_HTML.format(content=msg["content"]))
+        elif msg["role"] == "assistant":
+            latest_idx, latest_msg = len(parts), msg
+            parts.append(PREV_ASSISTANT_HTML.format(content=msg["content"]))
 
-        except Exception as e:
-            st.error(f"Audio processing failed: {e}")
-            user_text = None
+    # Only a reply that ends the conversation is emphasized; while one is still
+    # streaming in, the question is last and every earlier answer stays faded.
+    if latest_msg is not None and latest_idx == len(parts) - 1:
+        parts[latest_idx] = LATEST_ASSISTANT_HTML.format(content=latest_msg["content"])
 
-    if user_text and user_text.strip():
-        st.session_state.messages.append({"role": "user", "content": user_text})
+    if parts:
+        st.markdown("".join(parts), unsafe_allow_html=True)
 
-        with st.spinner("Thinking..."):
-            try:
-                response = groq_client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=st.session_state.messages,
-                    temperature=0.7,
-                    max_tokens=250
-                )
-                bot_text = response.choices[0].message.content
-                st.session_state.messages.append({"role": "assistant", "content": bot_text})
-                st.session_state.scroll_after_message = True
 
-                audio_bytes = asyncio.run(_synthesize_speech(bot_text))
-                st.session_state.current_audio = audio_bytes
-                st.session_state.input_key += 1
-                st.rerun()
+render_history()
 
-            except Exception as e:
-                st.error(f"Error: {e}")
+st.markdown(DOCK_HTML, unsafe_allow_html=True)
 
-if "current_audio" in st.session_state and st.session_state.current_audio:
-    st.audio(st.session_state.current_audio, format="audio/mp3", autoplay=True)
-    del st.session_state.current_audio
+if "input_key" not in st.session_state:
+    st.session_state.input_key = 0
 
-if len(st.session_state.messages) > 1:
-    
+# components.html is used because st.markdown does not execute <script> tags.
+def scroll_to_bottom():
     components.html(
         """
         <script>
@@ -748,7 +746,77 @@ if len(st.session_state.messages) > 1:
         height=0,
         width=0
     )
-    
-    # Clear the scroll flag
-    if "scroll_after_message" in st.session_state:
-        del st.session_state.scroll_after_message 
+
+# Only the voice input is a fragment: submitting a recording reruns just this
+# block, not the CSS and history above it, while it is transcribed. A full
+# rerun then shows the question in the history, the reply streams in below
+# it, and a last rerun moves the finished reply into the history.
+@st.fragment
+def voice_input():
+    # Audio Input Widget - Now styled to be prominent and clear
+    audio_value = st.audio_input("Tap to Speak", sample_rate=WHISPER_SAMPLE_RATE, label_visibility="hidden", key=f"audio_input_{st.session_state.input_key}")
+
+    if audio_value:
+        with st.spinner("Listening..."):
+            try:
+                # The recording is already in memory; upload it as a (name, bytes, type) tuple.
+                audio_file = ("audio.wav", audio_value.getvalue(), "audio/wav")
+
+                try:
+                    transcription = get_groq_client(groq_api_key).audio.transcriptions.create(
+                        model="whisper-large-v3",
+                        file=audio_file,
+                        response_format="text",
+                        language="en"
+                    )
+                except Exception as groq_err:
+                    transcription = get_openai_client(openai_api_key).audio.transcriptions.create(
+                        model="whisper-1",
+                        file=audio_file,
+                        response_format="text",
+                        language="en"
+                    )
+
+                user_text = transcription.text if hasattr(transcription, 'text') else str(transcription)
+
+            except Exception as e:
+                st.error(f"Audio processing failed: {e}")
+                user_text = None
+
+        if user_text and user_text.strip():
+            st.session_state.messages.append({"role": "user", "content": user_text})
+            st.session_state.awaiting_reply = True
+            st.session_state.input_key += 1
+            st.rerun()
+
+    if st.session_state.pop("awaiting_reply", False):
+        with st.spinner("Thinking..."):
+            try:
+                # Bring the new question into view before the reply streams in under it.
+                scroll_to_bottom()
+                reply_placeholder = st.empty()
+                bot_text, audio_buffer = asyncio.run(
+                    _respond(_context_window(st.session_state.messages), reply_placeholder)
+                )
+                st.session_state.messages.append({"role": "assistant", "content": bot_text})
+                st.session_state.scroll_after_message = True
+
+                if audio_buffer is not None:
+                    st.session_state.current_audio = audio_buffer
+                st.rerun()
+
+            except Exception as e:
+                # Drop the unanswered question so the history keeps alternating turns.
+                st.session_state.messages.pop()
+                st.error(f"Error: {e}")
+
+
+voice_input()
+
+if st.session_state.get("current_audio") is not None:
+    st.audio(st.session_state.current_audio, format="audio/mp3", autoplay=True)
+    del st.session_state.current_audio
+
+# Scroll just once more after the finished reply lands in the history.
+if st.session_state.pop("scroll_after_message", False):
+    scroll_to_bottom()
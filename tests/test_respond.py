@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeGroq:
+    def __init__(self, deltas):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: iter(map(_chunk, deltas))))
+
+
+class FakePlaceholder:
+    def __init__(self):
+        self.renders = []
+
+    def markdown(self, body, **kwargs):
+        self.renders.append(body)
+
+
+def _run(monkeypatch, deltas, synthesize):
+    monkeypatch.setattr(app, "get_groq_client", lambda api_key: FakeGroq(deltas))
+    monkeypatch.setattr(app, "_synthesize_speech", synthesize)
+    return asyncio.run(app._respond([{"role": "system", "content": ""}], FakePlaceholder()))
+
+
+def test_audio_follows_sentence_order(monkeypatch):
+    finished = []
+
+    async def synthesize(text):
+        # The first sentence finishes last; the buffer must still follow the reply.
+        await asyncio.sleep(0.05 if text == "Hi there." else 0)
+        finished.append(text)
+        return [text.encode()]
+
+    reply, audio = _run(monkeypatch, ["Hi there. How", " are you? Fine", "."], synthesize)
+
+    assert reply == "Hi there. How are you? Fine."
+    assert finished[-1] == "Hi there."
+    assert audio.getvalue() == b"Hi there.How are you?Fine."
+
+
+def test_synthesis_concurrency_is_capped(monkeypatch):
+    active = 0
+    peak = 0
+
+    async def synthesize(text):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return [b"x"]
+
+    _run(monkeypatch, ["One. Two. Three. Four. Five. Six."], synthesize)
+
+    assert peak == app.TTS_MAX_CONCURRENCY
+
+
+def test_failed_sentence_keeps_reply(monkeypatch):
+    async def synthesize(text):
+        if text.startswith("Bad"):
+            raise RuntimeError("tts down")
+        return [text.encode()]
+
+    reply, audio = _run(monkeypatch, ["Good one. Bad one. Good again."], synthesize)
+
+    assert reply == "Good one. Bad one. Good again."
+    assert audio.getvalue() == b"Good one.Good again."
+
+def test_all_sentences_failed_returns_no_audio(monkeypatch):
+    async def synthesize(text):
+        raise RuntimeError("tts down")
+
+    reply, audio = _run(monkeypatch, ["Good one. Bad one."], synthesize)
+
+    assert reply == "Good one. Bad one."
+    assert audio is None
+
+
+
+def test_punctuation_only_fragments_are_not_spoken(monkeypatch):
+    spoken = []
+
+    async def synthesize(text):
+        spoken.append(text)
+        return [b"x"]
+
+    _run(monkeypatch, ["Hmm... ... ok."], synthesize)
+
+    assert spoken == ["Hmm...", "ok."]
+
+
+def test_unspeakable_reply_returns_no_audio(monkeypatch):
+    async def synthesize(text):
+        return [b"x"]
+
+    reply, audio = _run(monkeypatch, ["..."], synthesize)
+
+    assert reply == "..."
+    assert audio is None
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+@pytest.fixture
+def edge_tts(monkeypatch):
+    """Stub edge_tts and give each test an empty speech cache."""
+    calls = []
+    failing = set()
+
+    class Communicate:
+        def __init__(self, text, **kwargs):
+            self.text = text
+
+        async def stream(self):
+            calls.append(self.text)
+            if self.text in failing:
+                raise RuntimeError("tts down")
+            yield {"type": "WordBoundary"}
+            yield {"type": "audio", "data": self.text.encode()}
+
+    cache = (OrderedDict(), threading.Lock())
+    monkeypatch.setitem(sys.modules, "edge_tts", SimpleNamespace(Communicate=Communicate))
+    monkeypatch.setattr(app, "get_speech_cache", lambda: cache)
+    return SimpleNamespace(calls=calls, failing=failing, cache=cache[0])
+
+
+def _say(text):
+    return asyncio.run(app._synthesize_speech(text))
+
+
+def test_repeated_sentence_is_served_from_cache(edge_tts):
+    assert _say("Not much.") == [b"Not much."]
+    assert _say(" Not much. ") == [b"Not much."]
+
+    assert edge_tts.calls == ["Not much."]
+
+
+def test_least_recently_used_sentence_is_evicted(edge_tts, monkeypatch):
+    monkeypatch.setattr(app, "TTS_CACHE_SIZE", 2)
+
+    _say("One.")
+    _say("Two.")
+    _say("One.")  # Hit; "Two." is now the oldest entry.
+    _say("Three.")
+
+    assert [key[0] for key in edge_tts.cache] == ["One.", "Three."]
+    _say("One.")
+    _say("Two.")
+    assert edge_tts.calls == ["One.", "Two.", "Three.", "Two."]
+
+
+def test_failed_synthesis_is_not_cached(edge_tts):
+    edge_tts.failing.add("Bad.")
+    with pytest.raises(RuntimeError):
+        _say("Bad.")
+    assert not edge_tts.cache
+
+    edge_tts.failing.clear()
+    assert _say("Bad.") == [b"Bad."]
+    assert edge_tts.calls == ["Bad.", "Bad."]